@@ -35,7 +35,7 @@ def deploy(config_data):
     try:
         party_model_id = model_utils.gen_party_model_id(model_id=model_id, role=local_role, party_id=local_party_id)
         model = PipelinedModel(model_id=party_model_id, model_version=model_version)
-        model_data = model.collect_models(in_bytes=True)
+        model_data = model.collect_models(in_bytes=True, b64encode=False)
         if "pipeline.pipeline:Pipeline" not in model_data:
             raise Exception("Can not found pipeline file in model.")
 
@@ -80,7 +80,7 @@ def migration(config_data: dict):
                                 "Please choose another unify model version and try again.".format(
                     config_data["unify_model_version"]))
 
-        model_data = model.collect_models(in_bytes=True)
+        model_data = model.collect_models(in_bytes=True, b64encode=False)
         if "pipeline.pipeline:Pipeline" not in model_data:
             raise Exception("Can not found pipeline file in model.")
 
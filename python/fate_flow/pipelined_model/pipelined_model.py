@@ -15,19 +15,50 @@
 #
 import importlib
 import inspect
+import io
 import os
 import shutil
-import base64
-from ruamel import yaml
-from copy import deepcopy
+import binascii
+import yaml
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from filelock import FileLock
 import hashlib
+from google.protobuf.internal import api_implementation
 
-from os.path import join, getsize
 from fate_arch.common import file_utils
 from fate_arch.protobuf.python import default_empty_fill_pb2
 from fate_flow.settings import stat_logger, TEMP_DIRECTORY
 
+try:
+    # libyaml bindings, fall back to the pure python implementation if PyYAML was built without them
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
+
+_proto_buffer_classes = None
+
+# model caches up to this size (KB) are archived in memory
+IN_MEMORY_ARCHIVE_MAX_SIZE = 64 * 1024
+
+# below this total size (bytes) files are read and written one by one, threads only pay off for large buffers
+CONCURRENT_FILE_IO_MIN_SIZE = 1 << 20
+# shared by all models, threads are started on first use
+_file_io_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="model_file_io")
+
+
+def serialize_empty_fill_message():
+    fill_message = default_empty_fill_pb2.DefaultEmptyFillMessage()
+    fill_message.flag = 'set'
+    return fill_message.SerializeToString()
+
+
+# stored in place of proto buffers which serialize to nothing
+EMPTY_FILL_BYTES = serialize_empty_fill_message()
+
+# parsing with the pure python implementation is much slower than with the cpp/upb ones
+stat_logger.info("protobuf python implementation: {}".format(api_implementation.Type()))
+
 
 def local_cache_required(method):
     def magic(self, *args, **kwargs):
@@ -37,6 +68,83 @@ def local_cache_required(method):
     return magic
 
 
+def calculate_file_sha1(file_path, block_size=1 << 20):
+    sha1 = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def write_files(files):
+    """
+    write files, concurrently on the shared executor if they are large enough to pay for the threads
+    :param files: list of (file path, bytes)
+    :return:
+    """
+    def _write(file):
+        file_path, content = file
+        with open(file_path, "wb") as fw:
+            fw.write(content)
+
+    if len(files) <= 1 or sum(len(content) for _, content in files) < CONCURRENT_FILE_IO_MIN_SIZE:
+        for file in files:
+            _write(file)
+        return
+    list(_file_io_executor.map(_write, files))
+
+
+def read_files(file_paths):
+    """
+    read files, concurrently on the shared executor if they are large enough to pay for the threads
+    :param file_paths:
+    :return: list of bytes, in the order of file_paths
+    """
+    def _read(file_path):
+        with open(file_path, "rb") as fr:
+            return fr.read()
+
+    if len(file_paths) <= 1 or sum(os.path.getsize(file_path) for file_path in file_paths) < CONCURRENT_FILE_IO_MIN_SIZE:
+        return [_read(file_path) for file_path in file_paths]
+    return list(_file_io_executor.map(_read, file_paths))
+
+
+def calculate_dir_size(dir_path):
+    """
+    total size of the regular files under dir_path, using the stat info cached by scandir
+    :param dir_path:
+    :return: size in bytes
+    """
+    size = 0
+    with os.scandir(dir_path) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                size += calculate_dir_size(entry.path)
+            elif entry.is_file():
+                size += entry.stat().st_size
+    return size
+
+
+class HashingWriter(object):
+    """
+    Write-only file wrapper which hashes the bytes passing through it.
+    It does not support seek on purpose, so zipfile writes the archive sequentially.
+    """
+    def __init__(self, fp):
+        self.fp = fp
+        self.sha1 = hashlib.sha1()
+
+    def write(self, data):
+        self.sha1.update(data)
+        return self.fp.write(data)
+
+    def flush(self):
+        self.fp.flush()
+
+    def hexdigest(self):
+        return self.sha1.hexdigest()
+
+
 class PipelinedModel(object):
     def __init__(self, model_id, model_version):
         """
@@ -52,7 +160,10 @@ class PipelinedModel(object):
         self.variables_index_path = os.path.join(self.model_path, "variables", "index")
         self.variables_data_path = os.path.join(self.model_path, "variables", "data")
         self.default_archive_format = "zip"
+        # zipfile.ZIP_STORED skips compression, archiving is then bound by disk speed but the archive is larger
+        self.archive_compression = zipfile.ZIP_DEFLATED
         self.lock = self._lock
+        self._meta_cache = (None, None)
 
     @property
     def _lock(self):
@@ -80,9 +191,10 @@ class PipelinedModel(object):
         with self.lock:
             for path in [self.variables_index_path, self.variables_data_path]:
                 os.makedirs(path)
+            # copied rather than hard linked, the model cache is a snapshot of the proto definitions
             shutil.copytree(os.path.join(file_utils.get_python_base_directory(), "federatedml", "protobuf", "proto"), self.define_proto_path)
             with open(self.define_meta_path, "x", encoding="utf-8") as fw:
-                yaml.dump({"describe": "This is the model definition meta"}, fw, Dumper=yaml.RoundTripDumper)
+                yaml.dump({"describe": "This is the model definition meta"}, fw, Dumper=SafeDumper, default_flow_style=False)
 
     def save_component_model(self, component_name, component_module_name, model_alias, model_buffers, tracker_client=None):
         model_proto_index = {}
@@ -90,26 +202,25 @@ class PipelinedModel(object):
         component_model_storage_path = os.path.join(self.variables_data_path, component_name, model_alias)
         if not tracker_client:
             os.makedirs(component_model_storage_path, exist_ok=True)
+        files = []
         for model_name, buffer_object in model_buffers.items():
             storage_path = os.path.join(component_model_storage_path, model_name)
-            buffer_object_serialized_string = buffer_object.SerializeToString()
-            if not buffer_object_serialized_string:
-                fill_message = default_empty_fill_pb2.DefaultEmptyFillMessage()
-                fill_message.flag = 'set'
-                buffer_object_serialized_string = fill_message.SerializeToString()
+            buffer_object_serialized_string = buffer_object.SerializeToString(deterministic=True) or EMPTY_FILL_BYTES
             if not tracker_client:
-                with self.lock, open(storage_path, "wb") as fw:
-                    fw.write(buffer_object_serialized_string)
+                files.append((storage_path, buffer_object_serialized_string))
             else:
                 component_model["buffer"][storage_path.replace(file_utils.get_project_base_directory(), "")] = \
-                    base64.b64encode(buffer_object_serialized_string).decode()
+                    binascii.b2a_base64(buffer_object_serialized_string, newline=False).decode("ascii")
             model_proto_index[model_name] = type(buffer_object).__name__   # index of model name and proto buffer class name
             stat_logger.info("Save {} {} {} buffer".format(component_name, model_alias, model_name))
         if not tracker_client:
-            self.update_component_meta(component_name=component_name,
-                                       component_module_name=component_module_name,
-                                       model_alias=model_alias,
-                                       model_proto_index=model_proto_index)
+            # FileLock is reentrant, update_component_meta only bumps the lock counter here
+            with self.lock:
+                write_files(files)
+                self.update_component_meta(component_name=component_name,
+                                           component_module_name=component_module_name,
+                                           model_alias=model_alias,
+                                           model_proto_index=model_proto_index)
             stat_logger.info("Save {} {} successfully".format(component_name, model_alias))
         else:
             component_model["component_name"] = component_name
@@ -119,11 +230,12 @@ class PipelinedModel(object):
             tracker_client.save_component_output_model(component_model)
 
     def write_component_model(self, component_model):
+        files = []
         for storage_path, buffer_object_serialized_string in component_model.get("buffer").items():
             storage_path = file_utils.get_project_base_directory()+storage_path
             os.makedirs(os.path.dirname(storage_path), exist_ok=True)
-            with open(storage_path, "wb") as fw:
-                fw.write(base64.b64decode(buffer_object_serialized_string.encode()))
+            files.append((storage_path, binascii.a2b_base64(buffer_object_serialized_string)))
+        write_files(files)
         self.update_component_meta(component_name=component_model["component_name"],
                                    component_module_name=component_model["component_module_name"],
                                    model_alias=component_model["model_alias"],
@@ -143,27 +255,31 @@ class PipelinedModel(object):
                     model_buffers[model_name] = self.parse_proto_object(buffer_name=buffer_name,
                                                                         buffer_object_serialized_string=buffer_object_serialized_string)
                 else:
-                    model_buffers[model_name] = [buffer_name, base64.b64encode(buffer_object_serialized_string).decode()]
+                    model_buffers[model_name] = [buffer_name, binascii.b2a_base64(buffer_object_serialized_string, newline=False).decode("ascii")]
         return model_buffers
 
     @local_cache_required
     def collect_models(self, in_bytes=False, b64encode=True):
-        model_buffers = {}
-        with open(self.define_meta_path, "r", encoding="utf-8") as fr:
-            define_index = yaml.safe_load(fr)
+        define_index = self._load_define_meta()
+        buffers = []
         for component_name in define_index.get("model_proto", {}).keys():
             for model_alias, model_proto_index in define_index["model_proto"][component_name].items():
                 component_model_storage_path = os.path.join(self.variables_data_path, component_name, model_alias)
                 for model_name, buffer_name in model_proto_index.items():
-                    with open(os.path.join(component_model_storage_path, model_name), "rb") as fr:
-                        buffer_object_serialized_string = fr.read()
-                        if not in_bytes:
-                            model_buffers[model_name] = self.parse_proto_object(buffer_name=buffer_name,
-                                                                                buffer_object_serialized_string=buffer_object_serialized_string)
-                        else:
-                            if b64encode:
-                                buffer_object_serialized_string = base64.b64encode(buffer_object_serialized_string).decode()
-                            model_buffers["{}.{}:{}".format(component_name, model_alias, model_name)] = buffer_object_serialized_string
+                    buffers.append((component_name, model_alias, model_name, buffer_name,
+                                    os.path.join(component_model_storage_path, model_name)))
+
+        model_buffers = {}
+        buffer_object_serialized_strings = read_files([buffer[-1] for buffer in buffers])
+        for (component_name, model_alias, model_name, buffer_name, _), buffer_object_serialized_string in \
+                zip(buffers, buffer_object_serialized_strings):
+            if not in_bytes:
+                model_buffers[model_name] = self.parse_proto_object(buffer_name=buffer_name,
+                                                                    buffer_object_serialized_string=buffer_object_serialized_string)
+            else:
+                if b64encode:
+                    buffer_object_serialized_string = binascii.b2a_base64(buffer_object_serialized_string, newline=False).decode("ascii")
+                model_buffers["{}.{}:{}".format(component_name, model_alias, model_name)] = buffer_object_serialized_string
         return model_buffers
 
     def set_model_path(self):
@@ -174,20 +290,17 @@ class PipelinedModel(object):
         return os.path.exists(self.model_path)
 
     def save_pipeline(self, pipelined_buffer_object):
-        buffer_object_serialized_string = pipelined_buffer_object.SerializeToString()
-        if not buffer_object_serialized_string:
-            fill_message = default_empty_fill_pb2.DefaultEmptyFillMessage()
-            fill_message.flag = 'set'
-            buffer_object_serialized_string = fill_message.SerializeToString()
+        buffer_object_serialized_string = pipelined_buffer_object.SerializeToString(deterministic=True) or EMPTY_FILL_BYTES
         with self.lock, open(os.path.join(self.model_path, "pipeline.pb"), "wb") as fw:
             fw.write(buffer_object_serialized_string)
 
     @local_cache_required
     def packaging_model(self):
-        archive_file_path = shutil.make_archive(base_name=self.archive_model_base_path, format=self.default_archive_format, root_dir=self.model_path)
-
-        with open(archive_file_path, 'rb') as f:
-            sha1 = hashlib.sha1(f.read()).hexdigest()
+        if self.default_archive_format == "zip":
+            archive_file_path, sha1 = self.make_zip_archive()
+        else:
+            archive_file_path = shutil.make_archive(base_name=self.archive_model_base_path, format=self.default_archive_format, root_dir=self.model_path)
+            sha1 = calculate_file_sha1(archive_file_path)
         with open(archive_file_path + '.sha1', 'w', encoding='utf8') as f:
             f.write(sha1)
 
@@ -195,6 +308,39 @@ class PipelinedModel(object):
             self.model_id, self.model_version, archive_file_path, sha1))
         return archive_file_path
 
+    def make_zip_archive(self):
+        """
+        same layout as shutil.make_archive(format="zip"), the sha1 is computed while the archive is written
+        :return: archive file path and its sha1
+        """
+        archive_file_path = self.archive_model_file_path
+        os.makedirs(os.path.dirname(archive_file_path), exist_ok=True)
+        if self.calculate_model_file_size() <= IN_MEMORY_ARCHIVE_MAX_SIZE:
+            # small models are archived in memory and written to disk with a single write
+            with io.BytesIO() as buffer:
+                self.write_zip_archive(buffer)
+                with buffer.getbuffer() as archive:
+                    sha1 = hashlib.sha1(archive).hexdigest()
+                    with open(archive_file_path, "wb") as fw:
+                        fw.write(archive)
+        else:
+            with open(archive_file_path, "wb") as fw:
+                writer = HashingWriter(fw)
+                self.write_zip_archive(writer)
+                sha1 = writer.hexdigest()
+        return archive_file_path, sha1
+
+    def write_zip_archive(self, fp):
+        with zipfile.ZipFile(fp, "w", compression=self.archive_compression) as zf:
+            for root, dirs, files in os.walk(self.model_path):
+                for name in sorted(dirs):
+                    path = os.path.join(root, name)
+                    zf.write(path, os.path.relpath(path, self.model_path))
+                for name in files:
+                    path = os.path.join(root, name)
+                    if os.path.isfile(path):
+                        zf.write(path, os.path.relpath(path, self.model_path))
+
     def unpack_model(self, archive_file_path: str):
         if self.exists():
             raise FileExistsError("Model {} {} local cache already existed".format(self.model_id, self.model_version))
@@ -202,8 +348,7 @@ class PipelinedModel(object):
         if os.path.isfile(archive_file_path + '.sha1'):
             with open(archive_file_path + '.sha1', encoding='utf8') as f:
                 sha1_orig = f.read().strip()
-            with open(archive_file_path, 'rb') as f:
-                sha1 = hashlib.sha1(f.read()).hexdigest()
+            sha1 = calculate_file_sha1(archive_file_path)
             if sha1 != sha1_orig:
                 raise ValueError('Hash not match. path: {} expected: {} actual: {}'.format(
                     archive_file_path, sha1_orig, sha1))
@@ -224,38 +369,63 @@ class PipelinedModel(object):
         :return:
         """
         with self.lock, open(self.define_meta_path, "r+", encoding="utf-8") as f:
-            _define_index = yaml.safe_load(f)
-            if not isinstance(_define_index, dict):
+            define_index = yaml.load(f, Loader=SafeLoader)
+            if not isinstance(define_index, dict):
                 raise ValueError('Invalid meta file')
-            define_index = deepcopy(_define_index)
 
-            define_index["component_define"] = define_index.get("component_define", {})
-            define_index["component_define"][component_name] = define_index["component_define"].get(component_name, {})
-            define_index["component_define"][component_name].update({"module_name": component_module_name})
-            define_index["model_proto"] = define_index.get("model_proto", {})
-            define_index["model_proto"][component_name] = define_index["model_proto"].get(component_name, {})
-            define_index["model_proto"][component_name][model_alias] = define_index["model_proto"][component_name].get(model_alias, {})
-            define_index["model_proto"][component_name][model_alias].update(model_proto_index)
-
-            if define_index != _define_index:
+            component_define = define_index.setdefault("component_define", {}).setdefault(component_name, {})
+            dirty = "module_name" not in component_define or component_define["module_name"] != component_module_name
+            component_define["module_name"] = component_module_name
+
+            component_model_proto = define_index.setdefault("model_proto", {}).setdefault(component_name, {})
+            dirty = dirty or model_alias not in component_model_proto
+            alias_model_proto = component_model_proto.setdefault(model_alias, {})
+            for model_name, buffer_name in model_proto_index.items():
+                if model_name not in alias_model_proto or alias_model_proto[model_name] != buffer_name:
+                    alias_model_proto[model_name] = buffer_name
+                    dirty = True
+
+            if dirty:
+                # serialize first and write in one call instead of letting the emitter write node by node
+                serialized = yaml.dump(define_index, Dumper=SafeDumper, default_flow_style=False, sort_keys=False)
                 f.seek(0)
-                yaml.dump(define_index, f, Dumper=yaml.RoundTripDumper)
+                f.write(serialized)
                 f.truncate()
+                self._meta_cache = (None, None)
+
+    def _load_define_meta(self):
+        """
+        load meta info yaml, the parsed result is reused until the file changes,
+        it is shared by all callers and must not be modified
+        :return:
+        """
+        st = os.stat(self.define_meta_path)
+        key = (st.st_mtime_ns, st.st_size)
+        if self._meta_cache[0] == key:
+            return self._meta_cache[1]
+        with open(self.define_meta_path, "r", encoding="utf-8") as fr:
+            define_index = yaml.load(fr, Loader=SafeLoader)
+        self._meta_cache = (key, define_index)
+        return define_index
 
     @local_cache_required
     def get_model_proto_index(self, component_name, model_alias):
-        with open(self.define_meta_path, "r", encoding="utf-8") as fr:
-            define_index = yaml.safe_load(fr)
-        return define_index.get("model_proto", {}).get(component_name, {}).get(model_alias, {})
+        """
+        :return: a shallow copy of the cached index
+        """
+        define_index = self._load_define_meta()
+        return dict(define_index.get("model_proto", {}).get(component_name, {}).get(model_alias, {}))
 
     @local_cache_required
     def get_component_define(self, component_name=None):
-        with open(self.define_meta_path, "r", encoding="utf-8") as fr:
-            define_index = yaml.safe_load(fr)
+        """
+        :return: a shallow copy of the cached define, the nested dicts are shared and must be treated as read-only
+        """
+        define_index = self._load_define_meta()
 
         if component_name is not None:
-            return define_index.get("component_define", {}).get(component_name, {})
-        return define_index.get("component_define", {})
+            return dict(define_index.get("component_define", {}).get(component_name, {}))
+        return dict(define_index.get("component_define", {}))
 
     def parse_proto_object(self, buffer_name, buffer_object_serialized_string):
         try:
@@ -263,37 +433,44 @@ class PipelinedModel(object):
         except Exception as e:
             stat_logger.exception("Can not restore proto buffer object", e)
             raise e
+        if buffer_object_serialized_string == EMPTY_FILL_BYTES:
+            stat_logger.info('parse {} proto object with default values'.format(type(buffer_object).__name__))
+            return buffer_object
         try:
             buffer_object.ParseFromString(buffer_object_serialized_string)
-            stat_logger.info('parse {} proto object normal'.format(type(buffer_object).__name__))
-            return buffer_object
-        except Exception as e1:
-            try:
-                fill_message = default_empty_fill_pb2.DefaultEmptyFillMessage()
-                fill_message.ParseFromString(buffer_object_serialized_string)
-                buffer_object.ParseFromString(bytes())
-                stat_logger.info('parse {} proto object with default values'.format(type(buffer_object).__name__))
-                return buffer_object
-            except Exception as e2:
-                stat_logger.exception(e2)
-                raise e1
+        except Exception as e:
+            stat_logger.exception(e)
+            raise e
+        stat_logger.info('parse {} proto object normal'.format(type(buffer_object).__name__))
+        return buffer_object
 
     @classmethod
     def get_proto_buffer_class(cls, buffer_name):
+        global _proto_buffer_classes
+        if _proto_buffer_classes is None:
+            _proto_buffer_classes = cls.load_proto_buffer_classes()
+        return _proto_buffer_classes.get(buffer_name)
+
+    @classmethod
+    def load_proto_buffer_classes(cls):
+        """
+        import all generated proto modules once
+        :return: proto buffer class name to class
+        """
         package_path = os.path.join(file_utils.get_python_base_directory(), 'federatedml', 'protobuf', 'generated')
         package_python_path = 'federatedml.protobuf.generated'
+        proto_buffer_classes = {}
         for f in os.listdir(package_path):
-            if f.startswith('.'):
+            if f.startswith('.') or not f.endswith('.py'):
                 continue
             try:
-                proto_module = importlib.import_module(package_python_path + '.' + f.rstrip('.py'))
+                proto_module = importlib.import_module(package_python_path + '.' + f[:-len('.py')])
                 for name, obj in inspect.getmembers(proto_module):
-                    if inspect.isclass(obj) and name == buffer_name:
-                        return obj
+                    if inspect.isclass(obj):
+                        proto_buffer_classes.setdefault(name, obj)
             except Exception as e:
                 stat_logger.warning(e)
-        else:
-            return None
+        return proto_buffer_classes
 
     @property
     def archive_model_base_path(self):
@@ -304,7 +481,4 @@ class PipelinedModel(object):
         return "{}.{}".format(self.archive_model_base_path, self.default_archive_format)
 
     def calculate_model_file_size(self):
-        size = 0
-        for root, dirs, files in os.walk(self.model_path):
-            size += sum([getsize(join(root, name)) for name in files])
-        return round(size/1024)
+        return round(calculate_dir_size(self.model_path)/1024)
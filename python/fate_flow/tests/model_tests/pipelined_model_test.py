@@ -1,5 +1,5 @@
 import unittest
-from unittest.mock import patch
+from unittest.mock import patch, Mock
 
 import os
 import io
@@ -8,10 +8,12 @@ import hashlib
 import concurrent.futures
 from pathlib import Path
 from copy import deepcopy
-from zipfile import ZipFile
+from zipfile import ZipFile, ZIP_STORED, ZIP_DEFLATED
 
-from ruamel import yaml
+import yaml
 
+from federatedml.protobuf.generated.data_io_meta_pb2 import DataIOMeta
+from federatedml.protobuf.generated.data_io_param_pb2 import DataIOParam
 from fate_flow.pipelined_model.pipelined_model import PipelinedModel
 from fate_flow.settings import TEMP_DIRECTORY
 
@@ -67,7 +69,7 @@ class TestPipelinedModel(unittest.TestCase):
             self.assertEqual(fr.read(), 'abcbar')
 
     def test_update_component_meta_with_changes(self):
-        with patch('ruamel.yaml.dump', side_effect=yaml.dump) as yaml_dump:
+        with patch('yaml.dump', side_effect=yaml.dump) as yaml_dump:
             self.pipelined_model.update_component_meta(
                 'dataio_0', 'DataIO_v0', 'dataio', {
                     'DataIOMeta': 'DataIOMeta_v0',
@@ -90,9 +92,9 @@ class TestPipelinedModel(unittest.TestCase):
 
     def test_update_component_meta_without_changes(self):
         with open(self.pipelined_model.define_meta_path, 'w', encoding='utf8') as f:
-            yaml.dump(data_define_meta, f, Dumper=yaml.RoundTripDumper)
+            yaml.dump(data_define_meta, f, Dumper=yaml.SafeDumper)
 
-        with patch('ruamel.yaml.dump', side_effect=yaml.dump) as yaml_dump:
+        with patch('yaml.dump', side_effect=yaml.dump) as yaml_dump:
             self.pipelined_model.update_component_meta(*args_update_component_meta)
         yaml_dump.assert_not_called()
 
@@ -101,8 +103,8 @@ class TestPipelinedModel(unittest.TestCase):
         self.assertEqual(define_index, data_define_meta)
 
     def test_update_component_meta_multi_thread(self):
-        with patch('ruamel.yaml.safe_load', side_effect=yaml.safe_load) as yaml_load, \
-                patch('ruamel.yaml.dump', side_effect=yaml.dump) as yaml_dump, \
+        with patch('yaml.load', side_effect=yaml.load) as yaml_load, \
+                patch('yaml.dump', side_effect=yaml.dump) as yaml_dump, \
                 concurrent.futures.ThreadPoolExecutor(max_workers=100) as executor:
             for _ in range(100):
                 executor.submit(self.pipelined_model.update_component_meta, *args_update_component_meta)
@@ -113,11 +115,128 @@ class TestPipelinedModel(unittest.TestCase):
             define_index = yaml.safe_load(tmp)
         self.assertEqual(define_index, data_define_meta)
 
+    def test_get_component_define_cached(self):
+        with patch('yaml.load', side_effect=yaml.load) as yaml_load:
+            for _ in range(10):
+                self.assertEqual(self.pipelined_model.get_component_define(),
+                                 data_define_meta['component_define'])
+            self.assertEqual(yaml_load.call_count, 1)
+
+            self.pipelined_model.update_component_meta(
+                'dataio_0', 'DataIO_v0', 'dataio', {
+                    'DataIOMeta': 'DataIOMeta_v0',
+                    'DataIOParam': 'DataIOParam_v0',
+                }
+            )
+            self.assertEqual(self.pipelined_model.get_component_define('dataio_0'), {'module_name': 'DataIO_v0'})
+            self.assertEqual(yaml_load.call_count, 3)
+
+    def test_get_component_define_copy(self):
+        component_define = self.pipelined_model.get_component_define()
+        component_define['foobar'] = {'module_name': 'foobar'}
+        self.pipelined_model.get_component_define('dataio_0')['module_name'] = 'foobar'
+        self.pipelined_model.get_model_proto_index('dataio_0', 'dataio')['foobar'] = 'foobar'
+
+        self.assertEqual(self.pipelined_model.get_component_define(), data_define_meta['component_define'])
+        self.assertEqual(self.pipelined_model.get_model_proto_index('dataio_0', 'dataio'),
+                         data_define_meta['model_proto']['dataio_0']['dataio'])
+
     def test_update_component_meta_empty_file(self):
         open(self.pipelined_model.define_meta_path, 'w').close()
         with self.assertRaisesRegex(ValueError, 'Invalid meta file'):
             self.pipelined_model.update_component_meta(*args_update_component_meta)
 
+    def test_save_component_model(self):
+        model_buffers = {
+            'DataIOMeta': DataIOMeta(input_format='dense', with_label=True),
+            'DataIOParam': DataIOParam(header=['x0', 'x1']),
+        }
+        self.pipelined_model.save_component_model('dataio_0', 'DataIO', 'dataio', model_buffers)
+
+        self.assertEqual(self.pipelined_model.get_model_proto_index('dataio_0', 'dataio'), {
+            'DataIOMeta': 'DataIOMeta',
+            'DataIOParam': 'DataIOParam',
+        })
+        self.assertEqual(self.pipelined_model.read_component_model('dataio_0', 'dataio'), model_buffers)
+
+    def test_save_component_model_concurrent(self):
+        model_buffers = {
+            'DataIOMeta': DataIOMeta(input_format='dense', with_label=True),
+            'DataIOParam': DataIOParam(header=['x0', 'x1']),
+        }
+        with patch('fate_flow.pipelined_model.pipelined_model.CONCURRENT_FILE_IO_MIN_SIZE', 0), \
+                patch('fate_flow.pipelined_model.pipelined_model._file_io_executor.map', wraps=map) as executor_map:
+            self.pipelined_model.save_component_model('dataio_0', 'DataIO', 'dataio', model_buffers)
+        executor_map.assert_called_once()
+        self.assertEqual(self.pipelined_model.read_component_model('dataio_0', 'dataio'), model_buffers)
+
+    def test_save_empty_component_model(self):
+        model_buffers = {
+            'DataIOMeta': DataIOMeta(),
+            'DataIOParam': DataIOParam(),
+        }
+        self.pipelined_model.save_component_model('dataio_0', 'DataIO', 'dataio', model_buffers)
+        self.assertEqual(self.pipelined_model.read_component_model('dataio_0', 'dataio'), model_buffers)
+
+    def test_parse_proto_object_invalid(self):
+        with self.assertRaises(Exception):
+            self.pipelined_model.parse_proto_object('DataIOMeta', b'foobar')
+
+    def test_write_component_model(self):
+        model_buffers = {
+            'DataIOMeta': DataIOMeta(input_format='dense', with_label=True),
+            'DataIOParam': DataIOParam(header=['x0', 'x1']),
+        }
+        tracker_client = Mock()
+        self.pipelined_model.save_component_model('dataio_0', 'DataIO', 'dataio', model_buffers,
+                                                  tracker_client=tracker_client)
+        component_model, = tracker_client.save_component_output_model.call_args[0]
+
+        self.pipelined_model.write_component_model(component_model)
+        self.assertEqual(self.pipelined_model.read_component_model('dataio_0', 'dataio'), model_buffers)
+
+    def test_collect_models(self):
+        with open(self.pipelined_model.define_meta_path, 'w', encoding='utf8') as f:
+            yaml.dump({'describe': 'This is the model definition meta'}, f)
+        model_buffers = {
+            'DataIOMeta': DataIOMeta(input_format='dense', with_label=True),
+            'DataIOParam': DataIOParam(header=['x0', 'x1']),
+        }
+        self.pipelined_model.save_component_model('dataio_0', 'DataIO', 'dataio', model_buffers)
+
+        self.assertEqual(self.pipelined_model.collect_models(), model_buffers)
+        self.assertEqual(self.pipelined_model.collect_models(in_bytes=True, b64encode=False), {
+            'dataio_0.dataio:DataIOMeta': model_buffers['DataIOMeta'].SerializeToString(),
+            'dataio_0.dataio:DataIOParam': model_buffers['DataIOParam'].SerializeToString(),
+        })
+
+    def test_collect_models_concurrent(self):
+        with open(self.pipelined_model.define_meta_path, 'w', encoding='utf8') as f:
+            yaml.dump({'describe': 'This is the model definition meta'}, f)
+        model_buffers = {
+            'DataIOMeta': DataIOMeta(input_format='dense', with_label=True),
+            'DataIOParam': DataIOParam(header=['x0', 'x1']),
+        }
+        self.pipelined_model.save_component_model('dataio_0', 'DataIO', 'dataio', model_buffers)
+        with patch('fate_flow.pipelined_model.pipelined_model.CONCURRENT_FILE_IO_MIN_SIZE', 0), \
+                patch('fate_flow.pipelined_model.pipelined_model._file_io_executor.map', wraps=map) as executor_map:
+            self.assertEqual(self.pipelined_model.collect_models(), model_buffers)
+        executor_map.assert_called_once()
+
+    def test_get_proto_buffer_class(self):
+        buffer_class = self.pipelined_model.get_proto_buffer_class('DataIOMeta')
+        self.assertEqual(buffer_class.__name__, 'DataIOMeta')
+        with patch('importlib.import_module') as import_module:
+            self.assertIs(PipelinedModel.get_proto_buffer_class('DataIOMeta'), buffer_class)
+            self.assertIsNone(PipelinedModel.get_proto_buffer_class('foobar'))
+        import_module.assert_not_called()
+
+    def test_calculate_model_file_size(self):
+        size = 0
+        for root, dirs, files in os.walk(self.pipelined_model.model_path):
+            size += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+        self.assertEqual(self.pipelined_model.calculate_model_file_size(), round(size / 1024))
+
     def test_packaging_model(self):
         archive_file_path = self.pipelined_model.packaging_model()
         self.assertEqual(archive_file_path, self.pipelined_model.archive_model_file_path)
@@ -134,6 +253,48 @@ class TestPipelinedModel(unittest.TestCase):
             sha1_orig = g.read().strip()
         self.assertEqual(sha1, sha1_orig)
 
+    def test_packaging_model_streaming(self):
+        with patch('fate_flow.pipelined_model.pipelined_model.IN_MEMORY_ARCHIVE_MAX_SIZE', -1):
+            archive_file_path = self.pipelined_model.packaging_model()
+
+        with ZipFile(archive_file_path) as z:
+            with io.TextIOWrapper(z.open('define/define_meta.yaml'), encoding='utf8') as f:
+                define_index = yaml.safe_load(f)
+        self.assertEqual(define_index, data_define_meta)
+
+        with open(archive_file_path, 'rb') as f, open(archive_file_path + '.sha1', encoding='utf8') as g:
+            sha1 = hashlib.sha1(f.read()).hexdigest()
+            sha1_orig = g.read().strip()
+        self.assertEqual(sha1, sha1_orig)
+
+    def test_packaging_model_in_memory_error(self):
+        with patch('fate_flow.pipelined_model.pipelined_model.open', side_effect=FileNotFoundError('foobar'), create=True):
+            with self.assertRaisesRegex(FileNotFoundError, 'foobar'):
+                self.pipelined_model.packaging_model()
+
+    def test_packaging_model_stored(self):
+        self.pipelined_model.archive_compression = ZIP_STORED
+        archive_file_path = self.pipelined_model.packaging_model()
+        with ZipFile(archive_file_path) as z:
+            self.assertTrue(all(info.compress_type == ZIP_STORED for info in z.infolist()))
+
+        shutil.rmtree(self.pipelined_model.model_path, True)
+        self.pipelined_model.unpack_model(archive_file_path)
+        with open(self.pipelined_model.define_meta_path, encoding='utf8') as tmp:
+            define_index = yaml.safe_load(tmp)
+        self.assertEqual(define_index, data_define_meta)
+
+    def test_packaging_model_large_deflated(self):
+        with patch('fate_flow.pipelined_model.pipelined_model.IN_MEMORY_ARCHIVE_MAX_SIZE', -1):
+            archive_file_path = self.pipelined_model.packaging_model()
+        with ZipFile(archive_file_path) as z:
+            self.assertTrue(all(info.compress_type == ZIP_DEFLATED for info in z.infolist() if not info.is_dir()))
+
+    def test_packaging_model_small_deflated(self):
+        archive_file_path = self.pipelined_model.packaging_model()
+        with ZipFile(archive_file_path) as z:
+            self.assertTrue(all(info.compress_type == ZIP_DEFLATED for info in z.infolist() if not info.is_dir()))
+
     def test_packaging_model_not_exists(self):
         shutil.rmtree(self.pipelined_model.model_path, True)
         with self.assertRaisesRegex(FileNotFoundError, 'Can not found foobar v1 model local cache'):
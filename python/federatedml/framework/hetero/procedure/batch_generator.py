@@ -72,8 +72,7 @@ class Host(batch_info_sync.Host):
     def generate_batch_data(self):
         batch_index = 0
         for batch_data_inst in self.batch_data_insts:
-            LOGGER.info("batch_num: {}, batch_data_inst size:{}".format(
-                batch_index, batch_data_inst.count()))
+            LOGGER.info("batch_num: {}".format(batch_index))
             yield batch_data_inst
             batch_index += 1
 
@@ -50,13 +50,15 @@ class BaseLogisticRegression(BaseLinearModel):
         return data_instances.mapValues(lambda v: vec_dot(v.features, coef_) + intercept_)
 
     def get_single_model_param(self):
-        weight_dict = {}
         # LOGGER.debug("in get_single_model_param, model_weights: {}, coef: {}, header: {}".format(
         #     self.model_weights.unboxed, self.model_weights.coef_, self.header
         # ))
-        for idx, header_name in enumerate(self.header):
-            coef_i = self.model_weights.coef_[idx]
-            weight_dict[header_name] = coef_i
+        # coef_ builds a new array on every access, read it once
+        coef_ = self.model_weights.coef_.tolist()
+        if len(coef_) < len(self.header):
+            raise IndexError("model has {} coefficients but header has {} features".format(
+                len(coef_), len(self.header)))
+        weight_dict = dict(zip(self.header, coef_))
 
         result = {'iters': self.n_iter_,
                   'loss_history': self.loss_history,
@@ -118,11 +120,9 @@ class BaseLogisticRegression(BaseLinearModel):
     def load_single_model(self, single_model_obj):
         LOGGER.info("It's a binary task, start to load single model")
         feature_shape = len(self.header)
-        tmp_vars = np.zeros(feature_shape)
         weight_dict = dict(single_model_obj.weight)
-
-        for idx, header_name in enumerate(self.header):
-            tmp_vars[idx] = weight_dict.get(header_name)
+        tmp_vars = np.fromiter((weight_dict.get(header_name, np.nan) for header_name in self.header),
+                               dtype=np.float64, count=feature_shape)
 
         if self.fit_intercept:
             tmp_vars = np.append(tmp_vars, single_model_obj.intercept)
@@ -113,8 +113,6 @@ class HeteroLRGuest(HeteroLRBase):
                 # LOGGER.debug(f"MODEL_STEP In Batch {batch_index}, batch data count: {batch_feat_inst.count()}")
 
                 # Start gradient procedure
-                LOGGER.debug("iter: {}, before compute gradient, data count: {}".format(self.n_iter_,
-                                                                                        batch_feat_inst.count()))
                 optim_guest_gradient = self.gradient_loss_operator.compute_gradient_procedure(
                             batch_feat_inst,
                             self.encrypted_calculator,
@@ -0,0 +1,62 @@
+#
+#  Copyright 2019 The FATE Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import unittest
+
+import numpy as np
+
+from federatedml.linear_model.linear_model_weight import LinearModelWeights
+from federatedml.linear_model.logistic_regression.base_logistic_regression import BaseLogisticRegression
+from federatedml.param.init_model_param import InitParam
+from federatedml.protobuf.generated.lr_model_param_pb2 import LRModelParam
+
+
+class TestBaseLogisticRegression(unittest.TestCase):
+    def setUp(self):
+        self.model = BaseLogisticRegression()
+        self.model.init_param_obj = InitParam(fit_intercept=True)
+        self.model.header = ['x0', 'x1', 'x2']
+        self.model.n_iter_ = 3
+        self.model.model_weights = LinearModelWeights([0.1, -0.2, 0.3, 0.5], fit_intercept=True)
+
+    def test_save_load_single_model(self):
+        param = LRModelParam(**self.model.get_single_model_param())
+        self.assertEqual(dict(param.weight), {'x0': 0.1, 'x1': -0.2, 'x2': 0.3})
+
+        model = BaseLogisticRegression()
+        model.init_param_obj = InitParam(fit_intercept=True)
+        model.header = list(param.header)
+        model.load_single_model(param)
+        self.assertEqual(model.n_iter_, 3)
+        self.assertTrue(np.allclose(model.model_weights.coef_, [0.1, -0.2, 0.3]))
+        self.assertAlmostEqual(model.model_weights.intercept_, 0.5)
+
+    def test_load_single_model_missing_feature(self):
+        param = LRModelParam(**self.model.get_single_model_param())
+        self.model.header = ['x0', 'x3', 'x2']
+        self.model.load_single_model(param)
+        coef_ = self.model.model_weights.coef_
+        self.assertTrue(np.isnan(coef_[1]))
+        self.assertTrue(np.allclose(coef_[[0, 2]], [0.1, 0.3]))
+
+    def test_get_single_model_param_header_mismatch(self):
+        self.model.header = ['x0', 'x1', 'x2', 'x3']
+        with self.assertRaises(IndexError):
+            self.model.get_single_model_param()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -49,12 +49,14 @@ class FixedPointEndec(object):
             return field_element
         if is_table(float_tensor):
             s = self.base ** self.precision_fractional
-            upscaled = float_tensor.mapValues(lambda x: (x * s).astype(np.int64))
+            field = self.field
             if check_range:
-                assert upscaled.filter(lambda k, v: (np.abs(v) >= self.field / 2).any()).count() == 0, (
+                # checked on the input table, so encoding below takes a single pass
+                assert float_tensor.filter(
+                    lambda k, v: (np.abs((v * s).astype(np.int64)) >= field / 2).any()).count() == 0, (
                     f"{float_tensor} cannot be correctly embedded: choose bigger field or a lower precision"
                 )
-            field_element = upscaled.mapValues(lambda x: x % self.field)
+            field_element = float_tensor.mapValues(lambda x: (x * s).astype(np.int64) % field)
             return field_element
 
     def truncate(self, integer_tensor, idx=0):
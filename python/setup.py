@@ -221,6 +221,7 @@ install_requires = \
  'psutil==5.6.6',
  'pycryptodomex==3.6.6',
  'python-dotenv==0.13.0',
+ 'pyyaml==5.4.1',
  'redis==3.0.1',
  'requests-toolbelt==0.9.1',
  'requests==2.23.0',